@@ -1,14 +1,27 @@
 import os
 import logging
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+import orjson
+from cachetools import TTLCache
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes
 from urllib.parse import urlparse
 import re
-from flask import Flask
-from threading import Thread
+import secrets
+from aiohttp import web
 import asyncio
+import signal
+from functools import lru_cache
+
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
 
 # Enable logging
 logging.basicConfig(
@@ -17,40 +30,134 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Flask app for health checks
-app = Flask(__name__)
+# Configuration
+TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+PORT = int(os.environ.get('PORT', 10000))
+# Public base URL for webhook mode (Render sets RENDER_EXTERNAL_URL); polls if unset
+PUBLIC_URL = os.getenv("PUBLIC_URL") or os.getenv("RENDER_EXTERNAL_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+API_URL = "https://socialdownloder2.anshapi.workers.dev/"
+URL_RE = re.compile(r'https?://[^\s]+')
 
-@app.route('/')
-def home():
-    return "🤖 Telegram Social Downloader Bot is Running!"
+class ApiRetry(Retry):
+    """Retry policy that gives up immediately on read timeouts.
 
-@app.route('/health')
-def health():
-    return {"status": "healthy"}, 200
+    Resets and 5xx responses are still retried, but a stalled upstream costs
+    one read timeout instead of one per attempt.
+    """
 
-@app.route('/ping')
-def ping():
-    return "pong", 200
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            raise error
+        return super().increment(method, url, response, error, _pool, _stacktrace)
 
-# Configuration
-TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-API_URL = "https://socialdownloder2.anshapi.workers.dev/"
+# Shared HTTP session so repeated API calls reuse pooled keep-alive connections,
+# retrying transient upstream failures (5xx, resets) on the same pool
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=ApiRetry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504, 522, 524],
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False
+    )
+)
+SESSION.mount('https://', _adapter)
+SESSION.mount('http://', _adapter)
+# Only the start of the API response is ever used, so cap how much is read.
+# Responses larger than this are not drained, so their connection is closed
+# rather than returned to the pool; typical JSON replies fit well within it.
+API_READ_LIMIT = 8192
+# Keys the API may use for the download link, in order of preference
+DOWNLOAD_KEYS = ('url', 'downloadUrl', 'video_url')
+# Connect and read timeouts for API calls; a short connect timeout keeps
+# connection retries cheap
+API_TIMEOUT = (5, 30)
+# Recently resolved download links, kept within typical signed-URL lifetimes
+URL_CACHE = TTLCache(maxsize=2048, ttl=1800)
+
+# aiohttp app for health checks and webhooks, served on the bot's event loop
+HOME_BYTES = "🤖 Telegram Social Downloader Bot is Running!".encode()
+HEALTH_BYTES = b'{"status": "healthy"}'
+PING_BYTES = b"pong"
+
+routes = web.RouteTableDef()
+
+@routes.get('/')
+async def home(request):
+    return web.Response(body=HOME_BYTES, content_type='text/plain', charset='utf-8')
+
+@routes.get('/health')
+async def health(request):
+    return web.Response(body=HEALTH_BYTES, content_type='application/json')
+
+@routes.get('/ping')
+async def ping(request):
+    return web.Response(body=PING_BYTES, content_type='text/plain')
+
+@routes.post('/tg')
+async def telegram_webhook(request):
+    if application is None:
+        raise web.HTTPServiceUnavailable()
+    # Telegram echoes the secret_token given to set_webhook in this header
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not secrets.compare_digest(token, WEBHOOK_SECRET):
+        raise web.HTTPForbidden()
+    update = Update.de_json(orjson.loads(await request.read()), application.bot)
+    await application.update_queue.put(update)
+    return web.Response()
+
+app = web.Application()
+app.add_routes(routes)
+
+async def start_health_server(application: Application):
+    """Start the health check server alongside the bot."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    application.bot_data['health_runner'] = runner
+    await web.TCPSite(runner, '0.0.0.0', PORT).start()
+    logger.info("Health server started on port %s", PORT)
+
+async def stop_health_server(application: Application):
+    """Stop the health check server."""
+    runner = application.bot_data.pop('health_runner', None)
+    if runner:
+        await runner.cleanup()
 
 # Initialize Telegram Bot
 application = None
 if TOKEN:
-    application = Application.builder().token(TOKEN).build()
+    application = Application.builder().token(TOKEN).concurrent_updates(True).build()
     logger.info("Telegram bot application initialized")
 else:
     logger.warning("TELEGRAM_BOT_TOKEN not set!")
 
-# Bot Handlers
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    welcome_text = f"""
-👋 Welcome *{user.first_name}*!
+# Static keyboards and labels, built once at import
+START_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📸 Instagram", callback_data='help_instagram'),
+     InlineKeyboardButton("🎬 YouTube", callback_data='help_youtube')],
+    [InlineKeyboardButton("📘 Facebook", callback_data='help_facebook'),
+     InlineKeyboardButton("🐦 Twitter/X", callback_data='help_twitter')],
+    [InlineKeyboardButton("🎵 TikTok", callback_data='help_tiktok')]
+])
 
-🤖 *Social Media Downloader Bot*
+PLATFORM_NAMES = {
+    'instagram': '📸 Instagram',
+    'youtube': '🎬 YouTube',
+    'facebook': '📘 Facebook',
+    'twitter': '🐦 Twitter/X',
+    'tiktok': '🎵 TikTok'
+}
+
+def markdown_v2(text: str) -> str:
+    """Escape text for MarkdownV2, keeping its *bold* spans."""
+    return '*'.join(escape_markdown(part, version=2) for part in text.split('*'))
+
+# Static part of the welcome message, escaped once at import
+WELCOME_BODY = markdown_v2("""🤖 *Social Media Downloader Bot*
 
 Send me any social media URL to download content!
 Supported platforms: YouTube, Instagram, Facebook, Twitter/X, TikTok, etc.
@@ -61,22 +168,41 @@ Supported platforms: YouTube, Instagram, Facebook, Twitter/X, TikTok, etc.
 3. Get your download link!
 
 Example: https://www.youtube.com/watch?v=dQw4w9WgXcQ
-"""
-    
-    keyboard = [
-        [InlineKeyboardButton("📸 Instagram", callback_data='help_instagram'),
-         InlineKeyboardButton("🎬 YouTube", callback_data='help_youtube')],
-        [InlineKeyboardButton("📘 Facebook", callback_data='help_facebook'),
-         InlineKeyboardButton("🐦 Twitter/X", callback_data='help_twitter')],
-        [InlineKeyboardButton("🎵 TikTok", callback_data='help_tiktok')]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+""")
+
+@lru_cache(maxsize=2048)
+def render_welcome(first_name: str) -> str:
+    """Render the welcome message with the user's name escaped for MarkdownV2."""
+    return f"\n👋 Welcome *{escape_markdown(first_name, version=2)}*\\!\n\n{WELCOME_BODY}"
+
+def fetch_download_info(url: str):
+    """Call the API and return its status code and the head of the body."""
+    with SESSION.get(API_URL, params={'url': url}, timeout=API_TIMEOUT, stream=True) as response:
+        return response.status_code, response.raw.read(API_READ_LIMIT, decode_content=True)
+
+def extract_download_url(body: bytes):
+    """Return the download link from an API response body, if it has one."""
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return None
+    if isinstance(data, dict):
+        return next((data[k] for k in DOWNLOAD_KEYS if k in data), None)
+    return None
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so equivalent links share a cache entry."""
+    parsed = urlparse(url)
+    query = '&'.join(sorted(q for q in parsed.query.split('&') if q))
+    return parsed._replace(netloc=parsed.netloc.lower(), query=query, fragment='').geturl()
+
+# Bot Handlers
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
     await update.message.reply_text(
-        welcome_text,
-        reply_markup=reply_markup,
-        parse_mode='Markdown'
+        render_welcome(user.first_name),
+        reply_markup=START_MARKUP,
+        parse_mode='MarkdownV2'
     )
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -103,8 +229,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_text = update.message.text
     
     # Check if message contains URL
-    url_pattern = r'https?://[^\s]+'
-    urls = re.findall(url_pattern, message_text)
+    urls = URL_RE.findall(message_text)
     
     if urls:
         url = urls[0]
@@ -127,25 +252,21 @@ async def process_url(update: Update, context: ContextTypes.DEFAULT_TYPE, url: s
     )
     
     try:
-        # Call the API
-        params = {'url': url}
-        response = requests.get(API_URL, params=params, timeout=30)
+        cache_key = normalize_url(url)
+        download_url = URL_CACHE.get(cache_key)
+        status_code = 200
         
-        if response.status_code == 200:
-            # Try to parse JSON response
-            try:
-                data = response.json()
-                if 'url' in data:
-                    download_url = data['url']
-                elif 'downloadUrl' in data:
-                    download_url = data['downloadUrl']
-                elif 'video_url' in data:
-                    download_url = data['video_url']
+        if download_url is None:
+            # Call the API without blocking the event loop
+            status_code, body = await asyncio.to_thread(fetch_download_info, url)
+            if status_code == 200:
+                download_url = extract_download_url(body)
+                if download_url:
+                    URL_CACHE[cache_key] = download_url
                 else:
-                    download_url = response.text[:200]
-            except:
-                download_url = response.text[:200]
-            
+                    download_url = body.decode('utf-8', 'replace')[:200]
+        
+        if status_code == 200:
             # Create inline keyboard with download button
             keyboard = [[InlineKeyboardButton("⬇️ Download Now", url=download_url)]]
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -160,12 +281,12 @@ async def process_url(update: Update, context: ContextTypes.DEFAULT_TYPE, url: s
             await processing_msg.edit_text(
                 f"❌ *Error*\n\n"
                 f"Could not download this content.\n"
-                f"Status Code: {response.status_code}\n\n"
+                f"Status Code: {status_code}\n\n"
                 f"Try another URL or try again later."
             )
             
     except Exception as e:
-        logger.error(f"Error processing URL: {e}")
+        logger.exception("Error processing URL %s", url)
         await processing_msg.edit_text(
             f"❌ *Error*\n\n"
             f"Could not process this URL.\n"
@@ -173,46 +294,72 @@ async def process_url(update: Update, context: ContextTypes.DEFAULT_TYPE, url: s
             f"Please try another URL."
         )
 
+async def help_callback(query, platform: str):
+    """Show usage for a single platform."""
+    platform_name = PLATFORM_NAMES.get(platform, platform.title())
+    await query.edit_message_text(
+        f"ℹ️ *{platform_name} Support*\n\n"
+        f"Send any {platform_name} URL to download content!\n\n"
+        f"Examples:\n"
+        f"• Videos\n"
+        f"• Reels/Shorts\n"
+        f"• Posts\n"
+        f"• Stories\n\n"
+        f"Just copy and paste the URL!",
+        parse_mode='Markdown'
+    )
+
+# Callback handlers keyed by callback_data prefix
+CALLBACK_HANDLERS = {
+    'help_': help_callback,
+}
+
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks."""
     query = update.callback_query
     await query.answer()
     
-    data = query.data
-    
-    if data.startswith('help_'):
-        platform = data[5:]
-        platform_names = {
-            'instagram': '📸 Instagram',
-            'youtube': '🎬 YouTube', 
-            'facebook': '📘 Facebook',
-            'twitter': '🐦 Twitter/X',
-            'tiktok': '🎵 TikTok'
-        }
-        platform_name = platform_names.get(platform, platform.title())
-        await query.edit_message_text(
-            f"ℹ️ *{platform_name} Support*\n\n"
-            f"Send any {platform_name} URL to download content!\n\n"
-            f"Examples:\n"
-            f"• Videos\n"
-            f"• Reels/Shorts\n"
-            f"• Posts\n"
-            f"• Stories\n\n"
-            f"Just copy and paste the URL!",
-            parse_mode='Markdown'
-        )
+    prefix, sep, arg = query.data.partition('_')
+    handler = CALLBACK_HANDLERS.get(prefix + sep)
+    if handler:
+        await handler(query, arg)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Log errors."""
-    logger.error(f"Update {update} caused error {context.error}")
+    logger.error("Update %s caused error %s", update, context.error)
 
-def run_flask():
-    """Run Flask web server."""
-    port = int(os.environ.get('PORT', 10000))
-    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
+async def serve():
+    """Run the bot and the aiohttp app on one event loop until signalled."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Not supported on Windows; Ctrl+C still cancels asyncio.run
+            pass
+    
+    async with application:
+        await application.start()
+        try:
+            await start_health_server(application)
+            if PUBLIC_URL:
+                # Receive updates through the aiohttp app instead of polling
+                await application.bot.set_webhook(
+                    url=f"{PUBLIC_URL}/tg",
+                    secret_token=WEBHOOK_SECRET
+                )
+            else:
+                await application.updater.start_polling()
+            await stop_event.wait()
+        finally:
+            if application.updater.running:
+                await application.updater.stop()
+            await stop_health_server(application)
+            await application.stop()
 
 def run_bot():
-    """Run Telegram bot in separate thread."""
+    """Run Telegram bot and health server on one event loop."""
     if not TOKEN:
         logger.error("TELEGRAM_BOT_TOKEN not set! Bot cannot start.")
         return
@@ -224,8 +371,11 @@ def run_bot():
     application.add_handler(CallbackQueryHandler(button_callback))
     
     # Start the bot
-    logger.info("Starting Telegram bot polling...")
-    application.run_polling()
+    if PUBLIC_URL:
+        logger.info("Starting Telegram bot webhook at %s...", PUBLIC_URL)
+    else:
+        logger.info("Starting Telegram bot polling...")
+    asyncio.run(serve())
 
 def main():
     """Main function to start both services."""
@@ -235,20 +385,14 @@ def main():
     if not TOKEN:
         logger.error("TELEGRAM_BOT_TOKEN environment variable is not set!")
         logger.info("Please set it in Render environment variables")
-        logger.info("Flask will still run for health checks, but bot won't start.")
-    
-    # Start Flask in main thread
-    flask_thread = Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    
-    logger.info(f"Flask server started on port {os.environ.get('PORT', 10000)}")
+        logger.info("Health server will still run, but bot won't start.")
     
-    # Start Telegram bot in current thread
+    # Start Telegram bot; it also starts the health server
     if TOKEN:
         run_bot()
     else:
-        # If no token, just keep Flask running
-        flask_thread.join()
+        # If no token, just serve health checks
+        web.run_app(app, host='0.0.0.0', port=PORT, print=None)
 
 if __name__ == '__main__':
     main()